@@ -1,503 +1,748 @@
-import json
-import socket
-import urllib.request
-from io import BytesIO
-from pathlib import Path
-
-from flask import Flask, render_template, request, jsonify, send_file
-import qrcode
-from difflib import SequenceMatcher
-import threading
-import subprocess
-import time
-import re
-
-BASE_DIR = Path(__file__).resolve().parent
-DATA_FILE = BASE_DIR / "data" / "knowledge_base.json"
-CALENDAR_PDF = BASE_DIR / "7th-sem-calendar-of-events.pdf"
-
-app = Flask(__name__, static_folder="static", template_folder="templates")
-
-# ---------------- NETWORK HANDLING ----------------
-def get_local_ip():
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-    except Exception:
-        ip = "127.0.0.1"
-    finally:
-        s.close()
-    return ip
-
-def get_ngrok_url():
-    try:
-        with urllib.request.urlopen("http://127.0.0.1:4040/api/tunnels") as response:
-            data = json.load(response)
-            for tunnel in data.get("tunnels", []):
-                if "public_url" in tunnel:
-                    return tunnel["public_url"]
-    except Exception:
-        return None
-
-def start_ngrok():
-    try:
-        subprocess.Popen(
-            ["ngrok", "http", "5000"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    except FileNotFoundError:
-        print("⚠️ Ngrok not found. Install from https://ngrok.com/download and connect your account.")
-        print("   Once installed, run: ngrok config add-authtoken YOUR_TOKEN")
-
-# ---------------- KNOWLEDGE BASE ----------------
-def load_kb():
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-KB = load_kb()
-
-PDF_DATA = KB.get("pdf_data", {})
-CAL_EVENTS = PDF_DATA.get("calendar_events", [])
-TT_A = PDF_DATA.get("timetable_A", [])
-TT_B = PDF_DATA.get("timetable_B", [])
-SUBJECTS = PDF_DATA.get("subjects", [])
-SEM_QNA = KB.get("semester_qna", [])
-
-# ---------------- TEXT & QUERY SYSTEM ----------------
-def normalize_text(q: str) -> str:
-    synonyms = {
-        "faculties": "faculty",
-        "professors": "faculty",
-        "teachers": "faculty",
-        "lecturers": "faculty",
-        "staffs": "staff",
-        "incharge": "hod",
-        "head of department": "hod",
-        "leader": "hod",
-        "head": "hod",
-        "dept": "department",
-        "academic calendar": "calendar",
-        "calendar of events": "calendar",
-        "event calendar": "calendar",
-        "events calendar": "calendar",
-        "time table": "timetable",
-        "time-table": "timetable",
-        "fees": "fee",
-        "examination": "exam",
-        "7th sem": "seventh semester",
-        "7th semester": "seventh semester",
-        "7 th sem": "seventh semester",
-    }
-    q = q.lower().strip()
-    for word, replacement in synonyms.items():
-        q = q.replace(word, replacement)
-    return q
-
-def similarity(a: str, b: str) -> float:
-    return SequenceMatcher(None, a, b).ratio()
-
-def contains_any(q: str, words):
-    return any(w in q for w in words)
-
-def intent_match(q: str, keywords):
-    return any(k in q or similarity(q, k) > 0.72 for k in keywords)
-
-def find_department(query_lc: str):
-    for dept in KB.get("departments", []):
-        name = dept.get("name", "").lower()
-        short = dept.get("short", "").lower()
-        if name in query_lc or short in query_lc:
-            return dept
-    best = None
-    best_score = 0.0
-    for dept in KB.get("departments", []):
-        for key in [dept.get("name", ""), dept.get("short", "")]:
-            score = similarity(query_lc, key.lower())
-            if score > best_score:
-                best_score = score
-                best = dept
-    if best_score > 0.6:
-        return best
-    return None
-
-def find_calendar_event(q: str):
-    best = None
-    best_score = 0.0
-    for ev in CAL_EVENTS:
-        text = (ev.get("title", "") + " " + ev.get("date", "")).lower()
-        score = similarity(q, text)
-        if score > best_score:
-            best_score = score
-            best = ev
-    if best_score > 0.55:
-        return best
-    return None
-
-def find_semantic_qna(q: str):
-    best = None
-    best_score = 0.0
-    for qa in SEM_QNA:
-        ques = qa.get("question", "").lower()
-        score = similarity(q, ques)
-        if score > best_score:
-            best_score = score
-            best = qa
-    if best_score > 0.7:
-        return best
-    return None
-
-def find_subject_by_name_or_code(q: str):
-    best = None
-    best_score = 0.0
-    for s in SUBJECTS:
-        for key in [s.get("name", ""), s.get("code", "")]:
-            score = similarity(q, key.lower())
-            if score > best_score:
-                best_score = score
-                best = s
-    if best_score > 0.6:
-        return best
-    return None
-
-def find_day_timetable(tt_list, day_name):
-    for row in tt_list:
-        if row.get("day", "").lower() == day_name.lower():
-            return row
-    return None
-
-def build_full_timetable_html(tt_list, section_label):
-    if not tt_list:
-        return "Timetable information is not available."
-    
-    max_periods = max(len(r.get("periods", [])) for r in tt_list)
-    header_cells = "".join(f"<th>P{i}</th>" for i in range(1, max_periods + 1))
-    rows_html = []
-    
-    for r in tt_list:
-        periods = r.get("periods", [])
-        row_cells = "".join(f"<td>{p}</td>" for p in periods)
-        if len(periods) < max_periods:
-            row_cells += "".join("<td>-</td>" for _ in range(max_periods - len(periods)))
-        rows_html.append(f"<tr><td>{r.get('day','')}</td>{row_cells}</tr>")
-    
-    table = f"""
-    <div class="timetable-container">
-      <strong>📅 7th Semester {section_label.upper()} Timetable</strong>
-      <table class="timetable">
-        <thead>
-          <tr><th>Day</th>{header_cells}</tr>
-        </thead>
-        <tbody>
-          {''.join(rows_html)}
-        </tbody>
-      </table>
-    </div>
-    """
-    return table
-
-def build_single_day_table_html(row, section_label):
-    periods = row.get("periods", [])
-    if not periods:
-        return f"No timetable available for {row.get('day', 'this day')}."
-    
-    header_cells = "".join(f"<th>P{i}</th>" for i in range(1, len(periods) + 1))
-    row_cells = "".join(f"<td>{p}</td>" for p in periods)
-    
-    table = f"""
-    <div class="timetable-container">
-      <strong>📋 {row.get('day','').capitalize()} - 7th Sem {section_label.upper()}</strong>
-      <table class="timetable">
-        <thead>
-          <tr><th>Day</th>{header_cells}</tr>
-        </thead>
-        <tbody>
-          <tr><td>{row.get('day','')}</td>{row_cells}</tr>
-        </tbody>
-      </table>
-    </div>
-    """
-    return table
-
-def answer_query(query: str) -> str:
-    q = normalize_text(query)
-
-    college = KB.get("college", {})
-    principal = college.get("principal", {})
-    vice_principal = college.get("vice principal", {})
-
-    # ---- Direct semester_qna ----
-    qa = find_semantic_qna(q)
-    if qa:
-        return qa.get("answer", "Information not available.")
-
-    # ---- Calendar link ----
-    if intent_match(q, ["calendar", "schedule of events", "exam schedule", "academic schedule"]):
-        return "You can view or download the Academic Calendar here: <a href='/calendar' target='_blank'>Open Academic Calendar (PDF)</a>"
-
-    # ---- Specific calendar event ----
-    if intent_match(q, ["independence day", "ganesha", "deepavali", "conference", "rajyotsava",
-                       "phase-1", "phase-2", "cie-1", "cie-2", "industrial visit",
-                       "last working day", "lab internals", "report submission", "practical exams", "theory exams"]):
-        ev = find_calendar_event(q)
-        if ev:
-            return f"{ev.get('title', 'Event')}: {ev.get('date', 'Date not available')}."
-
-    # ---- Vice Principal ----
-    if any(word in q for word in ["vice principal", "viceprincipal", "vp", "assistant principal"]):
-        name = vice_principal.get("name", "Not available")
-        spec = vice_principal.get("specialization", "")
-        detail = f" (Specialization: {spec})" if spec else ""
-        return f"Vice Principal: {name}{detail}"
-
-    # ---- Principal ----
-    if any(word in q for word in ["principal", "head of college", "college principal"]):
-        name = principal.get("name", "Not available")
-        spec = principal.get("specialization", "")
-        contact = principal.get("contact", "")
-        extra = []
-        if spec:
-            extra.append(f"Specialization: {spec}")
-        if contact:
-            extra.append(f"Contact: {contact}")
-        detail = " · ".join(extra)
-        return f"Principal: {name}" + (f" ({detail})" if detail else "")
-
-    # ---- HOD ----
-    if intent_match(q, ["hod", "head of department"]):
-        dept = find_department(q)
-        if dept:
-            return f"HOD of {dept['name']}: {dept.get('hod', 'Not available')}"
-        else:
-            return "Please specify a valid department for HOD information."
-
-    # ---- Faculty ----
-    if intent_match(q, ["faculty", "professor", "staff"]):
-        dept = find_department(q)
-        if dept:
-            members = ", ".join(f['name'] for f in dept.get("faculty", []))
-            return f"{dept['name']} Faculty Members: {members}"
-        else:
-            return "Please specify a valid department for faculty information."
-
-    # ---- Fees ----
-    if intent_match(q, ["fee", "exam fee", "payment", "tuition"]):
-        fees = KB.get("fees", {})
-        exam_last = fees.get("exam_fee_last_date", "N/A")
-        tuition_last = fees.get("tuition_fee_last_date", "N/A")
-        portal = fees.get("payment_portal", "N/A")
-
-        dept = find_department(q)
-        if dept:
-            short = dept.get("short", "").lower()
-            dept_fees = fees.get("department_fees", {}).get(short, {})
-            t = dept_fees.get("tuition")
-            e = dept_fees.get("exam")
-            parts = []
-            if t:
-                parts.append(f"{dept['name']} Tuition: {t}")
-            if e:
-                parts.append(f"{dept['name']} Exam Fee: {e}")
-            parts.append(f"Tuition Last Date: {tuition_last}")
-            parts.append(f"Exam Fee Last Date: {exam_last}")
-            parts.append(f"Payment via: {portal}")
-            return " | ".join(parts)
-
-        return f"Tuition Last Date: {tuition_last} | Exam Fee Last Date: {exam_last} | Payment via: {portal}"
-
-    # ---- Departments (only general info) ----
-    if intent_match(q, ["department", "cse", "ece", "computer", "electronics"]) and not intent_match(q, ["hod", "faculty", "professor", "staff"]):
-        dept = find_department(q)
-        if dept:
-            name = dept.get("name", "Department")
-            loc = dept.get("location", "Location not available")
-            courses = ", ".join(dept.get("courses", [])) or "Not specified"
-            return f"{name} is located at {loc}. Courses offered: {courses}."
-        else:
-            return "Please specify a valid department."
-
-    # ---- Timetable (HTML structured table) ----
-    if intent_match(q, ["timetable", "class schedule", "time table", "periods"]):
-        section = "A"
-        if " section b" in q or " b " in q or "sem b" in q:
-            section = "B"
-
-        tt_list = TT_A if section == "A" else TT_B
-        days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
-        day_in_q = None
-        for d in days:
-            if d in q:
-                day_in_q = d
-                break
-
-        if day_in_q:
-            row = find_day_timetable(tt_list, day_in_q)
-            if row:
-                return build_single_day_table_html(row, section)
-            else:
-                return f"Timetable for {day_in_q.capitalize()} (7th sem {section}) not available."
-        else:
-            return build_full_timetable_html(tt_list, section)
-
-    # ---- Subjects (codes, faculty, credits) ----
-    if intent_match(q, ["subject", "code", "credits", "faculty for", "who teaches", "teacher of"]):
-        subj = find_subject_by_name_or_code(q)
-        if subj:
-            code = subj.get("code", "")
-            name = subj.get("name", "")
-            fac = subj.get("faculty", "Faculty not specified")
-            credits = subj.get("credits", None)
-            parts = [f"{code} — {name}", f"Faculty: {fac}"]
-            if credits is not None:
-                parts.append(f"Credits: {credits}")
-            return " | ".join(parts)
-        else:
-            return "Please specify a valid subject."
-
-    # ---- Facilities ----
-    if intent_match(q, ["library", "canteen", "hostel", "facility", "facilities"]):
-        facs = KB.get("facilities", [])
-        for f in facs:
-            name_l = f.get("name", "").lower()
-            if name_l and name_l in q:
-                loc = f.get("location", "Location not available")
-                hours = f.get("hours", "")
-                dirn = f.get("directions", "")
-                notes = f.get("notes", "")
-                parts = [f"{f['name']} — {loc}"]
-                if hours:
-                    parts.append(f"Hours: {hours}")
-                if notes:
-                    parts.append(f"Notes: {notes}")
-                if dirn:
-                    parts.append(f"Directions: {dirn}")
-                return " | ".join(parts)
-        brief = []
-        for f in facs:
-            brief.append(f"{f.get('name', 'Facility')} — {f.get('location', 'Location not available')}")
-        if brief:
-            return "Facilities: " + " | ".join(brief)
-
-    # ---- Labs ----
-    if intent_match(q, ["lab", "laboratory"]):
-        labs = KB.get("labs", [])
-        for lab in labs:
-            name_l = lab.get("name", "").lower()
-            if name_l and (name_l in q or name_l.split()[0] in q):
-                loc = lab.get("location", "Location not available")
-                dirn = lab.get("directions", "")
-                parts = [f"{lab['name']} — {loc}"]
-                if dirn:
-                    parts.append(f"Directions: {dirn}")
-                return " | ".join(parts)
-        short = []
-        for lab in labs:
-            short.append(f"{lab.get('name', 'Lab')} — {lab.get('location', 'Location not available')}")
-        if short:
-            return "Labs: " + " | ".join(short)
-
-    # ---- Events ----
-    if intent_match(q, ["event", "orientation", "hackathon", "function"]):
-        events = KB.get("events", [])
-        if not events:
-            return "No events information is available right now."
-        lines = []
-        for e in events:
-            title = e.get("title", "Event")
-            date = e.get("date", "Date N/A")
-            venue = e.get("venue", "Venue N/A")
-            lines.append(f"{title} — {date} at {venue}")
-        return "Upcoming / scheduled events: " + " | ".join(lines)
-
-    # ---- College name ----
-    if intent_match(q, ["college name", "what is this college", "which college", "name of college"]):
-        return f"This helpdesk is for: {college.get('name', 'Our College')}."
-
-    # ---- Directions generic ----
-    if contains_any(q, ["where is", "location of", "how to reach", "how do i go"]):
-        dept = find_department(q)
-        if dept:
-            loc = dept.get("location", "Location not available")
-            dirn = dept.get("directions", "")
-            ans = f"{dept['name']} is at {loc}."
-            if dirn:
-                ans += f" Directions: {dirn}"
-            return ans
-
-        facs = KB.get("facilities", [])
-        for f in facs:
-            name_l = f.get("name", "").lower()
-            if name_l and name_l in q:
-                loc = f.get("location", "Location not available")
-                dirn = f.get("directions", "")
-                ans = f"{f['name']} is at {loc}."
-                if dirn:
-                    ans += f" Directions: {dirn}"
-                return ans
-
-    # ---- Fallback ----
-    return ("I can help with details about principal, <strong>vice principal</strong>, HOD, faculty, fees, <strong>timetable tables</strong>, "
-            "departments, labs, facilities, semester calendar events, subjects, and academic calendar PDF. "
-            "Try asking: 'Vice principal', 'CSE HOD', '<strong>Monday timetable for 7th sem A</strong>', "
-            "'Who teaches IoT?', or 'Exam fee last date?'.")
-
-def split_questions(text: str):
-    parts = re.split(r"\s*[\.\?\;]+\s*|\s+and\s+", text)
-    questions = [q.strip() for q in parts if q.strip()]
-    return questions
-
-# ---------------- ROUTES ----------------
-@app.route("/")
-def home():
-    base_url = getattr(app, "public_url", None)
-    if not base_url:
-        base_url = f"http://{get_local_ip()}:5000"
-    college_name = KB.get("college", {}).get("name", "Our College")
-    return render_template("index.html", base_url=base_url, college_name=college_name)
-
-@app.route("/ask", methods=["POST"])
-def ask():
-    data = request.get_json(force=True)
-    query = (data.get("question") or "").strip()
-    if not query:
-        return jsonify({"answer": "Please type a question."})
-    questions = split_questions(query)
-    answers = []
-    for q in questions:
-        ans = answer_query(q)
-        answers.append(ans)
-    return jsonify({"answer": "<br>".join(answers)})
-
-@app.route("/calendar")
-def calendar_pdf():
-    return send_file(
-        CALENDAR_PDF,
-        download_name="7th-sem-calendar-of-events.pdf",
-        mimetype="application/pdf",
-    )
-
-@app.route("/qr")
-def qr():
-    url = getattr(app, "public_url", None)
-    if not url:
-        url = f"http://{get_local_ip()}:5000"
-    img = qrcode.make(url)
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return send_file(buf, mimetype="image/png")
-
-# ---------------- RUN SERVER ----------------
-if __name__ == "__main__":
-    print("🚀 Starting Flask server...")
-    threading.Thread(target=start_ngrok).start()
-    print("🌐 Creating public ngrok tunnel... Please wait 5–10 seconds.")
-    time.sleep(8)
-    app.public_url = get_ngrok_url()
-    if app.public_url:
-        print(f"✅ PUBLIC URL: {app.public_url}")
-        print("📱 Open /qr to scan from any network.")
-    else:
-        print("⚠️ Could not detect ngrok link. The app is only accessible on local Wi‑Fi.")
-    app.run(host="0.0.0.0", port=5000, debug=True)
+import functools
+import hashlib
+import json
+import os
+import shutil
+import socket
+import urllib.request
+from io import BytesIO
+from pathlib import Path
+
+from flask import Flask, redirect, render_template, request, jsonify, send_from_directory, url_for
+from flask.json.provider import JSONProvider
+import qrcode
+import ahocorasick
+import numpy as np
+import orjson
+from rank_bm25 import BM25Plus
+from rapidfuzz import fuzz, process
+import threading
+import subprocess
+import time
+import re
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_FILE = BASE_DIR / "knowledge_base.json"
+CALENDAR_PDF = BASE_DIR / "7th-sem-calendar-of-events.pdf"
+
+app = Flask(__name__, static_folder="static", template_folder="templates")
+
+class OrjsonProvider(JSONProvider):
+    """Encode/decode Flask JSON (jsonify, request.get_json) via orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
+# Static assets are immutable (the QR filename is content-addressed), so
+# let browsers cache them for a day and serve them without Python views.
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400
+
+STATIC_DIR = Path(app.static_folder)
+STATIC_DIR.mkdir(exist_ok=True)
+if CALENDAR_PDF.exists():
+    _pdf_static = STATIC_DIR / CALENDAR_PDF.name
+    if not _pdf_static.exists() or _pdf_static.stat().st_mtime < CALENDAR_PDF.stat().st_mtime:
+        shutil.copy2(CALENDAR_PDF, _pdf_static)
+
+# ---------------- NETWORK HANDLING ----------------
+@functools.lru_cache(maxsize=1)
+def get_local_ip():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+    except Exception:
+        ip = "127.0.0.1"
+    finally:
+        s.close()
+    return ip
+
+_NGROK_TTL = 60.0
+_ngrok_cache = {"at": 0.0, "url": None}
+
+def get_ngrok_url():
+    # Only successful lookups are cached, so startup polling still sees a
+    # tunnel as soon as it comes up.
+    if _ngrok_cache["url"] and time.monotonic() - _ngrok_cache["at"] < _NGROK_TTL:
+        return _ngrok_cache["url"]
+    try:
+        with urllib.request.urlopen("http://127.0.0.1:4040/api/tunnels", timeout=1) as response:
+            data = json.load(response)
+            for tunnel in data.get("tunnels", []):
+                if "public_url" in tunnel:
+                    _ngrok_cache["at"] = time.monotonic()
+                    _ngrok_cache["url"] = tunnel["public_url"]
+                    return _ngrok_cache["url"]
+    except Exception:
+        return None
+
+def start_ngrok():
+    try:
+        subprocess.Popen(
+            ["ngrok", "http", "5000"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        print("⚠️ Ngrok not found. Install from https://ngrok.com/download and connect your account.")
+        print("   Once installed, run: ngrok config add-authtoken YOUR_TOKEN")
+
+# ---------------- KNOWLEDGE BASE ----------------
+def load_kb():
+    return orjson.loads(DATA_FILE.read_bytes())
+
+# ---------------- BM25 RETRIEVAL ----------------
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall(text.lower())
+
+def build_bm25_index(docs, text_of):
+    """Build a BM25 index over a list of KB objects.
+
+    Returns (bm25, docs) where bm25 is None for an empty corpus.
+    """
+    corpus = [tokenize(text_of(doc)) for doc in docs]
+    if not corpus:
+        return (None, docs, [])
+    return (BM25Plus(corpus), docs, [frozenset(toks) for toks in corpus])
+
+def bm25_best(index, q_tokens, min_score, unique_coverage=False):
+    bm25, docs, token_sets = index
+    if bm25 is None or not q_tokens:
+        return None
+    scores = bm25.get_scores(q_tokens)
+    # BM25Plus grants delta*idf to every document for each in-vocabulary
+    # query term; subtract that floor so min_score measures real term overlap.
+    floor = bm25.delta * sum(bm25.idf.get(t, 0.0) for t in q_tokens)
+    best_i = int(np.argmax(scores))
+    if scores[best_i] - floor < min_score:
+        return None
+    if unique_coverage and len(scores) > 1:
+        # A best match that covers no query token the runner-up lacks is
+        # riding on tokens shared across the corpus ("who teaches ..."),
+        # not a real hit.
+        rest = np.delete(scores, best_i)
+        second_i = int(np.argmax(rest))
+        if second_i >= best_i:
+            second_i += 1
+        qset = frozenset(q_tokens)
+        if token_sets[best_i] & qset == token_sets[second_i] & qset:
+            return None
+    return docs[best_i]
+
+# ---------------- TEXT & QUERY SYSTEM ----------------
+_SYNONYMS = {
+    "faculties": "faculty",
+    "professors": "faculty",
+    "teachers": "faculty",
+    "lecturers": "faculty",
+    "staffs": "staff",
+    "incharge": "hod",
+    "head of department": "hod",
+    "leader": "hod",
+    "head": "hod",
+    "dept": "department",
+    "academic calendar": "calendar",
+    "calendar of events": "calendar",
+    "event calendar": "calendar",
+    "events calendar": "calendar",
+    "time table": "timetable",
+    "time-table": "timetable",
+    "fees": "fee",
+    "examination": "exam",
+    "7th sem": "seventh semester",
+    "7th semester": "seventh semester",
+    "7 th sem": "seventh semester",
+}
+
+# Longest keys first so multi-word synonyms win over their prefixes
+# ("head of department" before "head").
+_SYNONYM_RE = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(_SYNONYMS, key=len, reverse=True))) + r")\b"
+)
+
+def normalize_text(q: str) -> str:
+    return _SYNONYM_RE.sub(lambda m: _SYNONYMS[m.group(1)], q.lower().strip())
+
+def similarity(a: str, b: str) -> float:
+    return fuzz.ratio(a, b) / 100.0
+
+def fuzzy_best(keys_lc, docs, q, score_cutoff=75, scorer=fuzz.partial_ratio):
+    """Typo-tolerant fallback: best fuzzy match over pre-lowercased keys.
+
+    keys_lc and docs are aligned by index; returns the matched doc or None.
+    """
+    match = process.extractOne(q, keys_lc, scorer=scorer, score_cutoff=score_cutoff)
+    return docs[match[2]] if match else None
+
+# ---------------- INTENT ROUTING ----------------
+INTENT_KEYWORDS = {
+    "calendar": ["calendar", "schedule of events", "exam schedule", "academic schedule"],
+    "calendar_event": ["independence day", "ganesha", "deepavali", "conference", "rajyotsava",
+                       "phase-1", "phase-2", "cie-1", "cie-2", "industrial visit",
+                       "last working day", "lab internals", "report submission",
+                       "practical exams", "theory exams"],
+    "vice_principal": ["vice principal", "viceprincipal", "vp", "assistant principal"],
+    "principal": ["principal", "head of college", "college principal"],
+    "hod": ["hod", "head of department"],
+    "faculty": ["faculty", "professor", "staff"],
+    "fees": ["fee", "exam fee", "payment", "tuition"],
+    "department": ["department", "cse", "ece", "computer", "electronics"],
+    "timetable": ["timetable", "class schedule", "time table", "periods"],
+    "subject": ["subject", "code", "credits", "faculty for", "who teaches", "teacher of"],
+    "facility": ["library", "canteen", "hostel", "facility", "facilities"],
+    "lab": ["lab", "laboratory"],
+    "event": ["event", "orientation", "hackathon", "function"],
+    "college_name": ["college name", "what is this college", "which college", "name of college"],
+    "directions": ["where is", "location of", "how to reach", "how do i go"],
+}
+
+def _build_intent_automaton():
+    kw_intents = {}
+    for intent, kws in INTENT_KEYWORDS.items():
+        for kw in kws:
+            kw_intents.setdefault(kw, set()).add(intent)
+            # Word-boundary matching means "lab" no longer hits "labs";
+            # cover simple plurals of single-word keywords explicitly.
+            if " " not in kw and not kw.endswith("s"):
+                kw_intents.setdefault(kw + "s", set()).add(intent)
+    ac = ahocorasick.Automaton()
+    for kw, intents in kw_intents.items():
+        ac.add_word(kw, (kw, frozenset(intents)))
+    ac.make_automaton()
+    return ac
+
+INTENT_AC = _build_intent_automaton()
+
+def match_intents(q: str):
+    """Scan q once and return the set of intents whose keywords occur in it.
+
+    Matches are only accepted on word boundaries, so e.g. 'lab' no longer
+    fires inside 'syllabus'.
+    """
+    matched = set()
+    n = len(q)
+    for end, (kw, intents) in INTENT_AC.iter(q):
+        start = end - len(kw) + 1
+        if (start == 0 or not q[start - 1].isalnum()) and (end == n - 1 or not q[end + 1].isalnum()):
+            matched |= intents
+    return matched
+
+def find_department(query_lc: str):
+    st = STATE
+    for i, dept in enumerate(st.depts):
+        name = st.dept_names_lc[i]
+        short = st.dept_shorts_lc[i]
+        if (name and name in query_lc) or (short and short in query_lc):
+            return dept
+    dept = bm25_best(st.dept_bm25, tokenize(query_lc), min_score=1.0)
+    if dept:
+        return dept
+    return fuzzy_best(st.dept_names_lc, st.depts, query_lc)
+
+def find_calendar_event(q: str):
+    return bm25_best(STATE.cal_bm25, tokenize(q), min_score=1.5)
+
+_SECTION_RE = re.compile(r"\b(?:sem|semester|section|sec)\s*([ab])\b")
+
+def _marker_tokens(text: str):
+    # Tokens that pick out a specific question among near-duplicates:
+    # digits ("cie-1" vs "cie-2", "7th" vs "5th") and section letters.
+    # Section letters only count after "sem"/"section" so the article in
+    # "is there a lunch break" does not register as section A.
+    text = text.lower()
+    return frozenset(t for t in tokenize(text) if t.isdigit()) | frozenset(
+        _SECTION_RE.findall(text)
+    )
+
+def find_semantic_qna(q: str):
+    st = STATE
+    markers = _marker_tokens(q)
+    # Near-exact (possibly typo'd) question first: a strong whole-string
+    # ratio beats the bag-of-words score, which can latch onto generic
+    # tokens like "who teaches" shared by many questions.
+    qa = fuzzy_best(st.qna_questions_lc, st.sem_qna, q, score_cutoff=85, scorer=fuzz.ratio)
+    if qa and markers <= _marker_tokens(qa.get("question", "")):
+        return qa
+    qa = bm25_best(st.qna_bm25, tokenize(q), min_score=5.0, unique_coverage=True)
+    # The marker check applies here too: the per-day timetable questions
+    # in the KB only cover section A, so "monday timetable for section b"
+    # must fall through to the timetable handler instead of matching them.
+    if qa and not markers <= _marker_tokens(qa.get("question", "")):
+        return None
+    return qa
+
+def find_subject_by_name_or_code(q: str):
+    st = STATE
+    subj = bm25_best(st.subj_bm25, tokenize(q), min_score=1.0)
+    if subj:
+        return subj
+    return fuzzy_best(st.subj_names_lc, st.subjects, q, score_cutoff=60)
+
+def build_full_timetable_html(tt_list, section_label):
+    if not tt_list:
+        return "Timetable information is not available."
+    
+    max_periods = max(len(r.get("periods", [])) for r in tt_list)
+    header_cells = "".join(f"<th>P{i}</th>" for i in range(1, max_periods + 1))
+    rows_html = []
+    
+    for r in tt_list:
+        periods = r.get("periods", [])
+        row_cells = "".join(f"<td>{p}</td>" for p in periods)
+        if len(periods) < max_periods:
+            row_cells += "".join("<td>-</td>" for _ in range(max_periods - len(periods)))
+        rows_html.append(f"<tr><td>{r.get('day','')}</td>{row_cells}</tr>")
+    
+    table = f"""
+    <div class="timetable-container">
+      <strong>📅 7th Semester {section_label.upper()} Timetable</strong>
+      <table class="timetable">
+        <thead>
+          <tr><th>Day</th>{header_cells}</tr>
+        </thead>
+        <tbody>
+          {''.join(rows_html)}
+        </tbody>
+      </table>
+    </div>
+    """
+    return table
+
+def build_single_day_table_html(row, section_label):
+    periods = row.get("periods", [])
+    if not periods:
+        return f"No timetable available for {row.get('day', 'this day')}."
+    
+    header_cells = "".join(f"<th>P{i}</th>" for i in range(1, len(periods) + 1))
+    row_cells = "".join(f"<td>{p}</td>" for p in periods)
+    
+    table = f"""
+    <div class="timetable-container">
+      <strong>📋 {row.get('day','').capitalize()} - 7th Sem {section_label.upper()}</strong>
+      <table class="timetable">
+        <thead>
+          <tr><th>Day</th>{header_cells}</tr>
+        </thead>
+        <tbody>
+          <tr><td>{row.get('day','')}</td>{row_cells}</tr>
+        </tbody>
+      </table>
+    </div>
+    """
+    return table
+
+def answer_query(query: str) -> str:
+    refresh_kb()
+    return _answer_query_cached(normalize_text(query))
+
+# ---------------- INTENT HANDLERS ----------------
+FALLBACK_ANSWER = ("I can help with details about principal, <strong>vice principal</strong>, HOD, faculty, fees, <strong>timetable tables</strong>, "
+                   "departments, labs, facilities, semester calendar events, subjects, and academic calendar PDF. "
+                   "Try asking: 'Vice principal', 'CSE HOD', '<strong>Monday timetable for 7th sem A</strong>', "
+                   "'Who teaches IoT?', or 'Exam fee last date?'.")
+
+def _handle_calendar(q, intents):
+    return "You can view or download the Academic Calendar here: <a href='/calendar' target='_blank'>Open Academic Calendar (PDF)</a>"
+
+def _handle_calendar_event(q, intents):
+    ev = find_calendar_event(q)
+    if ev:
+        return f"{ev.get('title', 'Event')}: {ev.get('date', 'Date not available')}."
+    return None
+
+def _handle_vice_principal(q, intents):
+    vice_principal = STATE.kb.get("college", {}).get("vice principal", {})
+    name = vice_principal.get("name", "Not available")
+    spec = vice_principal.get("specialization", "")
+    detail = f" (Specialization: {spec})" if spec else ""
+    return f"Vice Principal: {name}{detail}"
+
+def _handle_principal(q, intents):
+    principal = STATE.kb.get("college", {}).get("principal", {})
+    name = principal.get("name", "Not available")
+    spec = principal.get("specialization", "")
+    contact = principal.get("contact", "")
+    extra = []
+    if spec:
+        extra.append(f"Specialization: {spec}")
+    if contact:
+        extra.append(f"Contact: {contact}")
+    detail = " · ".join(extra)
+    return f"Principal: {name}" + (f" ({detail})" if detail else "")
+
+def _handle_hod(q, intents):
+    dept = find_department(q)
+    if dept:
+        return f"HOD of {dept['name']}: {dept.get('hod', 'Not available')}"
+    else:
+        return "Please specify a valid department for HOD information."
+
+def _handle_faculty(q, intents):
+    dept = find_department(q)
+    if dept:
+        members = ", ".join(f['name'] for f in dept.get("faculty", []))
+        return f"{dept['name']} Faculty Members: {members}"
+    else:
+        return "Please specify a valid department for faculty information."
+
+def _handle_fees(q, intents):
+    fees = STATE.kb.get("fees", {})
+    exam_last = fees.get("exam_fee_last_date", "N/A")
+    tuition_last = fees.get("tuition_fee_last_date", "N/A")
+    portal = fees.get("payment_portal", "N/A")
+
+    dept = find_department(q)
+    if dept:
+        short = dept.get("short", "").lower()
+        dept_fees = fees.get("department_fees", {}).get(short, {})
+        t = dept_fees.get("tuition")
+        e = dept_fees.get("exam")
+        parts = []
+        if t:
+            parts.append(f"{dept['name']} Tuition: {t}")
+        if e:
+            parts.append(f"{dept['name']} Exam Fee: {e}")
+        parts.append(f"Tuition Last Date: {tuition_last}")
+        parts.append(f"Exam Fee Last Date: {exam_last}")
+        parts.append(f"Payment via: {portal}")
+        return " | ".join(parts)
+
+    return f"Tuition Last Date: {tuition_last} | Exam Fee Last Date: {exam_last} | Payment via: {portal}"
+
+def _handle_department(q, intents):
+    # General department info only; HOD/faculty questions take their own branch.
+    if intents & {"hod", "faculty"}:
+        return None
+    dept = find_department(q)
+    if dept:
+        name = dept.get("name", "Department")
+        loc = dept.get("location", "Location not available")
+        courses = ", ".join(dept.get("courses", [])) or "Not specified"
+        return f"{name} is located at {loc}. Courses offered: {courses}."
+    else:
+        return "Please specify a valid department."
+
+def _handle_timetable(q, intents):
+    # normalize_text expands "sem" to "semester", so match the section
+    # letter with the same regex the Q&A marker check uses instead of
+    # fixed substrings like "sem b".
+    section = "B" if "b" in _SECTION_RE.findall(q) or " b " in q else "A"
+
+    days = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+    day_in_q = None
+    for d in days:
+        if d in q:
+            day_in_q = d
+            break
+
+    if day_in_q:
+        html = STATE.day_tt_html.get((section, day_in_q))
+        if html:
+            return html
+        else:
+            return f"Timetable for {day_in_q.capitalize()} (7th sem {section}) not available."
+    else:
+        return STATE.full_tt_html[section]
+
+def _handle_subject(q, intents):
+    subj = find_subject_by_name_or_code(q)
+    if subj:
+        code = subj.get("code", "")
+        name = subj.get("name", "")
+        fac = subj.get("faculty", "Faculty not specified")
+        credits = subj.get("credits", None)
+        parts = [f"{code} — {name}", f"Faculty: {fac}"]
+        if credits is not None:
+            parts.append(f"Credits: {credits}")
+        return " | ".join(parts)
+    else:
+        return "Please specify a valid subject."
+
+def _handle_facility(q, intents):
+    st = STATE
+    for name_l, f in zip(st.facility_names_lc, st.facilities):
+        if name_l and name_l in q:
+            loc = f.get("location", "Location not available")
+            hours = f.get("hours", "")
+            dirn = f.get("directions", "")
+            notes = f.get("notes", "")
+            parts = [f"{f['name']} — {loc}"]
+            if hours:
+                parts.append(f"Hours: {hours}")
+            if notes:
+                parts.append(f"Notes: {notes}")
+            if dirn:
+                parts.append(f"Directions: {dirn}")
+            return " | ".join(parts)
+    brief = []
+    for f in st.facilities:
+        brief.append(f"{f.get('name', 'Facility')} — {f.get('location', 'Location not available')}")
+    if brief:
+        return "Facilities: " + " | ".join(brief)
+    return None
+
+def _handle_lab(q, intents):
+    st = STATE
+    for name_l, first_l, lab in zip(st.lab_names_lc, st.lab_first_lc, st.labs):
+        if name_l and (name_l in q or first_l in q):
+            loc = lab.get("location", "Location not available")
+            dirn = lab.get("directions", "")
+            parts = [f"{lab['name']} — {loc}"]
+            if dirn:
+                parts.append(f"Directions: {dirn}")
+            return " | ".join(parts)
+    short = []
+    for lab in st.labs:
+        short.append(f"{lab.get('name', 'Lab')} — {lab.get('location', 'Location not available')}")
+    if short:
+        return "Labs: " + " | ".join(short)
+    return None
+
+def _handle_event(q, intents):
+    events = STATE.kb.get("events", [])
+    if not events:
+        return "No events information is available right now."
+    lines = []
+    for e in events:
+        title = e.get("title", "Event")
+        date = e.get("date", "Date N/A")
+        venue = e.get("venue", "Venue N/A")
+        lines.append(f"{title} — {date} at {venue}")
+    return "Upcoming / scheduled events: " + " | ".join(lines)
+
+def _handle_college_name(q, intents):
+    return f"This helpdesk is for: {STATE.kb.get('college', {}).get('name', 'Our College')}."
+
+def _handle_directions(q, intents):
+    dept = find_department(q)
+    if dept:
+        loc = dept.get("location", "Location not available")
+        dirn = dept.get("directions", "")
+        ans = f"{dept['name']} is at {loc}."
+        if dirn:
+            ans += f" Directions: {dirn}"
+        return ans
+
+    st = STATE
+    for name_l, f in zip(st.facility_names_lc, st.facilities):
+        if name_l and name_l in q:
+            loc = f.get("location", "Location not available")
+            dirn = f.get("directions", "")
+            ans = f"{f['name']} is at {loc}."
+            if dirn:
+                ans += f" Directions: {dirn}"
+            return ans
+    return None
+
+# Priority order matches the original if/elif cascade.
+INTENT_HANDLERS = [
+    ("calendar", _handle_calendar),
+    ("calendar_event", _handle_calendar_event),
+    ("vice_principal", _handle_vice_principal),
+    ("principal", _handle_principal),
+    ("hod", _handle_hod),
+    ("faculty", _handle_faculty),
+    ("fees", _handle_fees),
+    ("department", _handle_department),
+    ("timetable", _handle_timetable),
+    ("subject", _handle_subject),
+    ("facility", _handle_facility),
+    ("lab", _handle_lab),
+    ("event", _handle_event),
+    ("college_name", _handle_college_name),
+    ("directions", _handle_directions),
+]
+
+@functools.lru_cache(maxsize=4096)
+def _answer_query_cached(q: str) -> str:
+    # ---- Direct semester_qna ----
+    qa = find_semantic_qna(q)
+    if qa:
+        return qa.get("answer", "Information not available.")
+
+    intents = match_intents(q)
+    # First matched intent in table order wins; a handler may return None
+    # to decline (e.g. no specific event found) and pass the query along.
+    for intent, handler in INTENT_HANDLERS:
+        if intent in intents:
+            ans = handler(q, intents)
+            if ans:
+                return ans
+
+    return FALLBACK_ANSWER
+
+# ---------------- KB-DERIVED STATE ----------------
+class KBState:
+    """The KB plus everything derived from it: the per-section lists,
+    pre-lowercased columns, BM25 indexes and precomputed timetable HTML.
+
+    Everything is built in the constructor and never mutated afterwards,
+    so a reload can build a fresh instance off to the side and swap it
+    into STATE with a single assignment; request threads always see
+    either the old state or the new one, never a half-rebuilt mix.
+    """
+
+    def __init__(self, kb):
+        self.kb = kb
+        pdf_data = kb.get("pdf_data", {})
+        self.cal_events = pdf_data.get("calendar_events", [])
+        self.tt_a = pdf_data.get("timetable_A", [])
+        self.tt_b = pdf_data.get("timetable_B", [])
+        self.subjects = pdf_data.get("subjects", [])
+        self.sem_qna = kb.get("semester_qna", [])
+        self.depts = kb.get("departments", [])
+        self.facilities = kb.get("facilities", [])
+        self.labs = kb.get("labs", [])
+
+        # Pre-lowercased columns aligned by index with their source lists, so
+        # hot loops compare ready-made strings instead of re-lowering each time.
+        # Fuzzy fallbacks use full names only; short codes like "cse" are too
+        # noisy under partial matching and are covered by the exact/BM25 passes.
+        self.dept_names_lc = [d.get("name", "").lower() for d in self.depts]
+        self.dept_shorts_lc = [d.get("short", "").lower() for d in self.depts]
+        self.subj_names_lc = [s.get("name", "").lower() for s in self.subjects]
+        self.qna_questions_lc = [qa.get("question", "").lower() for qa in self.sem_qna]
+        self.facility_names_lc = [f.get("name", "").lower() for f in self.facilities]
+        self.lab_names_lc = [lab.get("name", "").lower() for lab in self.labs]
+        self.lab_first_lc = [name.split()[0] if name else "" for name in self.lab_names_lc]
+
+        self.dept_bm25 = build_bm25_index(
+            self.depts,
+            lambda d: d.get("name", "") + " " + d.get("short", ""),
+        )
+        self.cal_bm25 = build_bm25_index(
+            self.cal_events,
+            lambda ev: ev.get("title", "") + " " + ev.get("date", ""),
+        )
+        self.qna_bm25 = build_bm25_index(self.sem_qna, lambda qa: qa.get("question", ""))
+        self.subj_bm25 = build_bm25_index(
+            self.subjects,
+            lambda s: s.get("name", "") + " " + s.get("code", ""),
+        )
+
+        # The timetables only change with the KB, so every timetable answer is
+        # one of a fixed set of strings; build them all here instead of per request.
+        self.full_tt_html = {
+            "A": build_full_timetable_html(self.tt_a, "A"),
+            "B": build_full_timetable_html(self.tt_b, "B"),
+        }
+        self.day_tt_html = {
+            (sec, row.get("day", "").lower()): build_single_day_table_html(row, sec)
+            for sec, tt in (("A", self.tt_a), ("B", self.tt_b))
+            for row in tt
+        }
+
+STATE = KBState(load_kb())
+KB_MTIME = DATA_FILE.stat().st_mtime
+_KB_LOCK = threading.Lock()
+
+def refresh_kb():
+    """Pick up KB file edits without a restart, re-parsing only on mtime change.
+
+    The lock ensures only one thread rebuilds; the mtime is re-checked
+    inside it so threads that queued up behind the rebuild return without
+    repeating it. The answer cache is cleared last, after the new state is
+    visible, so nothing computed against the old state lingers in it.
+    """
+    global STATE, KB_MTIME
+    try:
+        mtime = DATA_FILE.stat().st_mtime
+    except OSError:
+        return
+    if mtime == KB_MTIME:
+        return
+    with _KB_LOCK:
+        if mtime == KB_MTIME:
+            return
+        STATE = KBState(load_kb())
+        KB_MTIME = mtime
+        _answer_query_cached.cache_clear()
+
+_SPLIT_RE = re.compile(r"\s*[\.\?\;]+\s*|\s+and\s+")
+
+def split_questions(text: str):
+    return [q.strip() for q in _SPLIT_RE.split(text) if q.strip()]
+
+# ---------------- ROUTES ----------------
+@app.route("/")
+def home():
+    base_url = getattr(app, "public_url", None)
+    if not base_url:
+        base_url = f"http://{get_local_ip()}:5000"
+    college_name = STATE.kb.get("college", {}).get("name", "Our College")
+    return render_template("index.html", base_url=base_url, college_name=college_name)
+
+@app.route("/ask", methods=["POST"])
+def ask():
+    data = request.get_json(force=True)
+    query = (data.get("question") or "").strip()
+    if not query:
+        return jsonify({"answer": "Please type a question."})
+    questions = split_questions(query)
+    # Answer each distinct sub-question once, then map back in order.
+    unique_answers = {q: answer_query(q) for q in dict.fromkeys(questions)}
+    answers = [unique_answers[q] for q in questions]
+    return jsonify({"answer": "<br>".join(answers)})
+
+@app.route("/calendar")
+def calendar_pdf():
+    if (STATIC_DIR / CALENDAR_PDF.name).exists():
+        return redirect(url_for("static", filename=CALENDAR_PDF.name))
+    # conditional=True sets ETag/Last-Modified so repeat views get a 304.
+    return send_from_directory(
+        BASE_DIR,
+        CALENDAR_PDF.name,
+        mimetype="application/pdf",
+        max_age=86400,
+        conditional=True,
+    )
+
+@functools.lru_cache(maxsize=4)
+def _qr_png(url: str) -> bytes:
+    img = qrcode.make(url)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+@app.route("/qr")
+def qr():
+    url = getattr(app, "public_url", None)
+    if not url:
+        url = f"http://{get_local_ip()}:5000"
+    # Content-addressed filename: a new URL gets a new name, so the long
+    # static max_age can never serve a stale code.
+    fname = f"qr-{hashlib.md5(url.encode()).hexdigest()[:8]}.png"
+    path = STATIC_DIR / fname
+    if not path.exists():
+        path.write_bytes(_qr_png(url))
+    return redirect(url_for("static", filename=fname))
+
+# ---------------- RUN SERVER ----------------
+if __name__ == "__main__":
+    print("🚀 Starting Flask server...")
+    threading.Thread(target=start_ngrok).start()
+    print("🌐 Creating public ngrok tunnel...")
+    app.public_url = None
+    for _ in range(40):  # poll up to ~10 seconds instead of a fixed sleep
+        app.public_url = get_ngrok_url()
+        if app.public_url:
+            break
+        time.sleep(0.25)
+    if app.public_url:
+        print(f"✅ PUBLIC URL: {app.public_url}")
+        print("📱 Open /qr to scan from any network.")
+    else:
+        print("⚠️ Could not detect ngrok link. The app is only accessible on local Wi‑Fi.")
+    if os.environ.get("FLASK_DEBUG") == "1":
+        # Werkzeug dev server: auto-reload, single-threaded, opt-in only.
+        app.run(host="0.0.0.0", port=5000, debug=True)
+    else:
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=5000, threads=8)